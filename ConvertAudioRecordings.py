@@ -3,6 +3,8 @@
 import numpy as np
 from microphone import record_audio
 import librosa
+import soundfile as sf
+from scipy.signal import resample_poly
 
 def samples_mic(listen_time) -> np.ndarray:
 
@@ -15,7 +17,18 @@ def samples_mic(listen_time) -> np.ndarray:
 
 def samples_file(file_path: str):
 
-    # `recorded_audio` is a numpy array of N audio samples
-    recorded_audio, sampling_rate = librosa.load(file_path, sr=44100, mono=True)
-    
+    sampling_rate = 44100
+
+    # `recorded_audio` is a numpy array of N audio samples, shape-(N, channels)
+    try:
+        recorded_audio, file_rate = sf.read(file_path, dtype="float32", always_2d=True)
+    except RuntimeError:
+        # libsndfile builds older than 1.1 cannot decode MP3; librosa falls back to audioread
+        return librosa.load(file_path, sr=sampling_rate, mono=True)
+
+    # downmix to mono and resample to 44.1 kHz, staying in float32 throughout
+    recorded_audio = recorded_audio.mean(axis=1, dtype=np.float32)
+    if file_rate != sampling_rate:
+        recorded_audio = resample_poly(recorded_audio, sampling_rate, file_rate).astype(np.float32)
+
     return recorded_audio, sampling_rate
@@ -1,11 +1,12 @@
 import numpy as np
-import random
+from typing import Optional
 
 def random_samples(
     samples: np.ndarray,
     freq: int,
     n: int,
-    length: float) -> np.ndarray:
+    length: float,
+    rng: Optional[np.random.Generator] = None) -> np.ndarray:
     """
     Takes an array of audio samples from a long (e.g. one minute)
     recording and produce random clips of it at a desired, shorter length.
@@ -24,22 +25,28 @@ def random_samples(
         Number of random clips to generate
     length: float
         Length, in seconds, of each generated clip
+    rng: numpy.random.Generator, optional
+        Source of the random clip start times; pass a seeded generator
+        for reproducible clips
 
     Returns
     ----------
     numpy.ndarray, shape(n, length * freq)
-        An array of n arrays of samples, representing the n clips generated
+        An array of n arrays of samples, representing the n clips generated,
+        with the same dtype as `samples`
     """
+    if rng is None:
+        rng = np.random.default_rng()
+
     original_number_of_samples = np.size(samples)
     samples_per_clip = int(length * freq)
-    result = np.zeros((n, samples_per_clip))
     latest_start = original_number_of_samples - samples_per_clip
 
-    for i in range(n):
-        start = random.randint(0, latest_start)
-        result[i] = samples[start:start + samples_per_clip]
+    # gather all n clips at once: row i holds the indices start_i ... start_i + samples_per_clip - 1
+    starts = rng.integers(0, latest_start + 1, size=n)
+    idx = starts[:, None] + np.arange(samples_per_clip)[None, :]
 
-    return result
+    return samples[idx]
 
 if __name__ == "__main__":
     print(random_samples(np.arange(60000), 1000, 100, 10.0))
@@ -7,11 +7,21 @@ Note: Only produce_spectrogram, extract_local_peak_idxs, and form_fingerprints n
 """
 from audio_processing_config import configs as cfg
 import numpy as np
-from numba import njit
-import matplotlib.mlab as mlab
 from scipy.ndimage import generate_binary_structure
 from scipy.ndimage import iterate_structure
-from typing import Tuple, List
+from scipy.ndimage import maximum_filter
+from scipy.fft import rfft, rfftfreq
+
+
+# Number of STFT frames processed together by `produce_spectrogram`
+_STFT_TILE_FRAMES = 64
+
+# STFT frame length and its Hann window, built once rather than on every call
+_NFFT = 4096
+_HANN = np.hanning(_NFFT).astype(np.float32)
+
+# Neighborhood used to find peaks, fixed by the config at import
+_NBRHD = iterate_structure(generate_binary_structure(2, 1), cfg["neighborhood_iterations"])
 
 
 def produce_spectrogram(samples: np.ndarray, sampling_rate: float = 44100):
@@ -30,7 +40,7 @@ def produce_spectrogram(samples: np.ndarray, sampling_rate: float = 44100):
     -------
     Tuple[spectrogram, freqs, times]
         spectrogram : numpy.ndarray, shape-(F,T)
-            Array of amplitudes, in decibels
+            Array of amplitudes, in decibels (float32)
 
         freqs : numpy.ndarray, shape-(F,)
             Array of frequency values, in hertz (corresponds to y-axis)
@@ -38,68 +48,88 @@ def produce_spectrogram(samples: np.ndarray, sampling_rate: float = 44100):
         times : numpy.ndarray, shape-(T,)
             Array of time values, in seconds (corresponds to x-axis)
     """
-    spectrogram, freqs, times = mlab.specgram(
-        samples,
-        NFFT=4096,
-        Fs=sampling_rate,
-        window=mlab.window_hanning,
-        noverlap=int(4096/2)
-    )
-    spectrogram = np.log(np.clip(spectrogram, a_min=1e-20, a_max=None))
+    nfft = _NFFT
+    hop = nfft // 2  # 50% overlap between frames
+
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < nfft:
+        samples = np.pad(samples, (0, nfft - len(samples)))
+
+    window = _HANN
+    frames = np.lib.stride_tricks.sliding_window_view(samples, nfft)[::hop]  # shape-(T, nfft), no copy
+    n_freqs, n_frames = nfft // 2 + 1, len(frames)
+
+    # one-sided power spectral density, scaled as matplotlib.mlab.specgram does
+    psd_scale = np.full(n_freqs, 2 / (sampling_rate * np.square(window).sum()), dtype=np.float32)
+    psd_scale[[0, -1]] /= 2
+
+    # window -> rFFT -> power -> log is applied one tile of frames at a time, so that
+    # each intermediate stays cache-sized and only the final log-amplitudes are
+    # written out to the full (F, T) array
+    spectrogram = np.empty((n_freqs, n_frames), dtype=np.float32)
+    for start in range(0, n_frames, _STFT_TILE_FRAMES):
+        stop = min(start + _STFT_TILE_FRAMES, n_frames)
+        spectrum = rfft(frames[start:stop] * window, axis=1)
+        power = np.square(spectrum.real)
+        power += np.square(spectrum.imag)
+        power *= psd_scale
+        np.maximum(power, 1e-20, out=power)
+        np.log(power.T, out=spectrogram[:, start:stop])
+
+    freqs = rfftfreq(nfft, 1 / sampling_rate)
+    times = (nfft / 2 + hop * np.arange(spectrogram.shape[1])) / sampling_rate
     return spectrogram, freqs, times
 
 
-@njit
-def _peaks(data_2d: np.ndarray, nbrhd_row_offsets: np.ndarray, nbrhd_col_offsets: np.ndarray, amp_min: float) \
-        -> List[Tuple[int, int]]:
+def _neighborhood_max(data_2d: np.ndarray, neighborhood: np.ndarray) -> np.ndarray:
     """
-    A Numba-optimized 2-D peak-finding algorithm.
+    Computes the maximum of each datum's neighborhood, treating locations
+    outside of `data_2d` as -inf.
 
     Parameters
     ----------
     data_2d : numpy.ndarray, shape-(H, W)
-        The 2D array of data in which local peaks will be detected.
-
-    nbrhd_row_offsets : numpy.ndarray, shape-(N,)
-        The row-index offsets used to traverse the local neighborhood.
+        The 2D array of data to be max-filtered
 
-        E.g., given the row/col-offsets (dr, dc), the element at
-        index (r+dr, c+dc) will reside in the neighborhood centered at (r, c).
-
-    nbrhd_col_offsets : numpy.ndarray, shape-(N,)
-        The col-index offsets used to traverse the local neighborhood. See
-        `nbrhd_row_offsets` for more details.
-
-    amp_min : float
-        All amplitudes equal to or below this value are excluded from being
-        local peaks.
+    neighborhood : numpy.ndarray, shape-(h, w)
+        A boolean mask indicating the "neighborhood" of each datum
 
     Returns
     -------
-    List[Tuple[int, int]]
-        (row, col) index pair for each local peak location, returned in
-        column-major order
+    numpy.ndarray, shape-(H, W)
+        The maximum-filtered data
+
+    Notes
+    -----
+    The cost of filtering with a footprint grows with its number of cells.
+    The diamond produced by `iterate_structure(generate_binary_structure(2, 1), k)`
+    is the k-fold dilation of the 3x3 cross, so filtering with it is the same
+    as filtering k times with the cross, which is linear rather than quadratic in k.
+
+    Each cross pass is the element-wise maximum of five shifted views of the
+    data. Padding the data once with a border of -inf keeps every shifted view
+    in bounds, so the passes need no border handling at all.
     """
-    peaks = []
-
-    for c, r in np.ndindex(*data_2d.shape[::-1]):
-        if data_2d[r, c] <= amp_min:
-            continue
-        for dr, dc in zip(nbrhd_row_offsets, nbrhd_col_offsets):
-            if dr == 0 and dc == 0:
-                continue
-            if not (0 <= r + dr < data_2d.shape[0]):
-                continue
-            if not (0 <= c + dc < data_2d.shape[1]):
-                continue
-            if data_2d[r, c] < data_2d[r + dr, c + dc]:
-                break
-        else:
-            peaks.append((r, c))
-    return peaks
-
-
-def _local_peak_locations(data_2d: np.ndarray, neighborhood: np.ndarray, amp_min: float):
+    cross = generate_binary_structure(2, 1)
+    radius = neighborhood.shape[0] // 2
+    if (
+        neighborhood.shape == (2 * radius + 1, 2 * radius + 1)
+        and np.array_equal(neighborhood, iterate_structure(cross, radius))
+    ):
+        padded = np.pad(data_2d, 1, mode="constant", constant_values=-np.inf)
+        scratch = np.full_like(padded, -np.inf)
+        for _ in range(radius):
+            interior = scratch[1:-1, 1:-1]
+            np.maximum(padded[1:-1, 1:-1], padded[:-2, 1:-1], out=interior)
+            np.maximum(interior, padded[2:, 1:-1], out=interior)
+            np.maximum(interior, padded[1:-1, :-2], out=interior)
+            np.maximum(interior, padded[1:-1, 2:], out=interior)
+            padded, scratch = scratch, padded
+        return padded[1:-1, 1:-1]
+    return maximum_filter(data_2d, footprint=neighborhood, mode="constant", cval=-np.inf)
+
+
+def _local_peak_locations(data_2d: np.ndarray, neighborhood: np.ndarray, amp_min: float) -> np.ndarray:
     """
     Defines a local neighborhood and finds the local peaks
     in the spectrogram, which must be larger than the specified `amp_min`.
@@ -120,25 +150,29 @@ def _local_peak_locations(data_2d: np.ndarray, neighborhood: np.ndarray, amp_min
 
     Returns
     -------
-    List[Tuple[int, int]]
+    numpy.ndarray, shape-(N, 2)
         (row, col) index pair for each local peak location, returned
         in column-major ordering.
 
     Notes
     -----
+    A datum is a local peak if no element of its neighborhood is strictly
+    larger than it, i.e. if it equals the maximum-filtered value at its
+    location. Locations outside of `data_2d` never take part in the comparison.
+
     The local peaks are returned in column-major order, meaning that we
-    iterate over all nbrhd_row_offsets in a given column of `data_2d` in search for
-    local peaks, and then move to the next column.
+    collect all of the local peaks in a given column of `data_2d`, and then
+    move to the next column.
     """
     assert neighborhood.shape[0] % 2 == 1
     assert neighborhood.shape[1] % 2 == 1
 
-    nbrhd_row_indices, nbrhd_col_indices = np.where(neighborhood)
+    nbrhd_max = _neighborhood_max(data_2d, neighborhood)
+    is_peak = (data_2d == nbrhd_max) & (data_2d > amp_min)
 
-    nbrhd_row_offsets = nbrhd_row_indices - neighborhood.shape[0] // 2
-    nbrhd_col_offsets = nbrhd_col_indices - neighborhood.shape[1] // 2
-
-    return _peaks(data_2d, nbrhd_row_offsets, nbrhd_col_offsets, amp_min=amp_min)
+    # scanning the transpose yields the peaks sorted by column, then by row
+    cols, rows = np.nonzero(is_peak.T)
+    return np.column_stack([rows, cols])
 
 
 def _find_cutoff(spectrogram: np.ndarray) -> float:
@@ -155,7 +189,9 @@ def _find_cutoff(spectrogram: np.ndarray) -> float:
     float
         The amplitude at a given percentile.
     """
-    data = spectrogram.ravel()  # flattens spectrogram
+    # flattens spectrogram; float32 is plenty for a log-amplitude threshold, halves the
+    # bytes partitioned, and lets np.partition use its SIMD-vectorized kernel
+    data = np.ascontiguousarray(spectrogram, dtype=np.float32).ravel()
     idx = round(len(data) * cfg["amp_threshold_pct"])  # finds index of amp threshold percentile
     return np.partition(data, idx)[idx]
 
@@ -179,40 +215,37 @@ def extract_local_peak_idxs(spectrogram: np.ndarray):
     -----
     Index pairs map to (y,x) coordinate-wise.
     """
-    # create neighborhood used to find peaks
-    base_structure = generate_binary_structure(2, 1)
-    neighborhood = iterate_structure(base_structure, cfg["neighborhood_iterations"])
     # find value of minimum amp threshold (cutoff)
     cutoff = _find_cutoff(spectrogram)
-    return np.array(_local_peak_locations(spectrogram, neighborhood, cutoff))
+    return _local_peak_locations(spectrogram, _NBRHD, cutoff)
 
 
-def _form_pair_encoding(peak_m: np.ndarray, peak_n: np.ndarray):
+def _form_pair_encoding(peaks_m: np.ndarray, peaks_n: np.ndarray):
     """
-    Encodes the relationship between two peaks.
+    Encodes the relationship between pairs of peaks.
 
     Parameters
     ----------
-    peak_m : numpy.ndarray, shape-(2,)
-        First peak, (f, t) value pair
+    peaks_m : numpy.ndarray, shape-(K,2)
+        First peak of each pair, (f, t) value pairs
 
-    peak_n : numpy.ndarray, shape-(2,)
-        Second peak, (f, t) value pair
+    peaks_n : numpy.ndarray, shape-(K,2)
+        Second peak of each pair, (f, t) value pairs
 
     Returns
     -------
     Tuple[fm, fn, dt]
-        fm : float
-            Frequency value of first peak
-        fn : float
-            Frequency value of second peak
-        dt : float
-            Delta time value between two peaks (tn - tm)
+        fm : numpy.ndarray, shape-(K,)
+            Frequency values of first peaks
+        fn : numpy.ndarray, shape-(K,)
+            Frequency values of second peaks
+        dt : numpy.ndarray, shape-(K,)
+            Delta time values between the two peaks (tn - tm)
     """
-    return peak_m[0], peak_n[0], peak_n[1] - peak_m[1]
+    return peaks_m[:, 0], peaks_n[:, 0], peaks_n[:, 1] - peaks_m[:, 1]
 
 
-def form_fingerprints(local_peaks_idx: np.ndarray):
+def form_fingerprints(local_peaks_idx: np.ndarray) -> np.ndarray:
     """
     Forms the fingerprint for an audio recording.
 
@@ -224,17 +257,27 @@ def form_fingerprints(local_peaks_idx: np.ndarray):
 
     Returns
     -------
-    List[List[Tuple[int, int, int], int]]
+    numpy.ndarray, shape-(M,4)
         Aggregate of fanout patterns for all peaks in the audio
         recording which form the fingerprint for that recording.
+        Each row is a (fm, fn, dt, tm) quadruple: the peak-pair
+        encoding followed by the time of the first peak.
+
+    Notes
+    -----
+    Every peak is paired with (up to) the `fanout_size` peaks that follow it.
+    Rather than looping over peaks, the k-th neighbor of every peak is paired
+    at once by offsetting the peak array against itself by k.
     """
     fanout_size = cfg["fanout_size"]
-    # uses local peak indexes to zip freqs and times into (t, f) peak point coordinate pairs
-    fingerprints = []
-    for i, idx in enumerate(local_peaks_idx):
-        fanout = []
-        fanout_local_peaks = local_peaks_idx[i + 1: i + fanout_size + 1]
-        for close_peak in fanout_local_peaks:
-            fanout.append([_form_pair_encoding(idx, close_peak), idx[1]])
-        fingerprints.append(fanout)
-    return fingerprints
+    local_peaks_idx = np.asarray(local_peaks_idx, dtype=np.int32).reshape(-1, 2)
+
+    fanouts = []
+    for k in range(1, min(fanout_size, len(local_peaks_idx) - 1) + 1):
+        peaks_m, peaks_n = local_peaks_idx[:-k], local_peaks_idx[k:]
+        fm, fn, dt = _form_pair_encoding(peaks_m, peaks_n)
+        fanouts.append(np.column_stack([fm, fn, dt, peaks_m[:, 1]]))
+
+    if not fanouts:
+        return np.empty((0, 4), dtype=np.int32)
+    return np.concatenate(fanouts)
@@ -6,31 +6,94 @@ for all of the songs that a given peak-pair occurred in,
 along with the absolute time associated with each fanout pattern 
 """
 
+from array import array
+import numpy as np
+
+
+class Bucket:
+    """
+    The songIDs and times of every fingerprint stored under one database key,
+    kept as two parallel int32 arrays rather than a list of (songID, ts) tuples.
+    Appending costs no tuple allocation, and `query_database` can view each
+    array as a NumPy array without copying it.
+    """
+    __slots__ = ("song_ids", "times")
+
+    def __init__(self):
+        self.song_ids = array("i")
+        self.times = array("i")
+
+    def append(self, songID: int, ts: int):
+        self.song_ids.append(songID)
+        self.times.append(ts)
+
+    def __len__(self):
+        return len(self.song_ids)
+
+    def __getstate__(self):
+        # pickle the raw int32 contents rather than two array objects
+        return self.song_ids.tobytes(), self.times.tobytes()
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.song_ids.frombytes(state[0])
+        self.times.frombytes(state[1])
+
+
+def _pack_keys(fingerprints: np.ndarray) -> np.ndarray:
+    """
+    Packs the (fm, fn, dt) peak-pair encoding of each fingerprint row into a
+    single int64 database key: fm in the upper bits, then fn in 16 bits, then dt
+    in the lowest 16 bits. One integer hashes and compares much faster than a
+    3-tuple, and takes far less memory as a dict key.
+    """
+    fm, fn, dt = fingerprints[:, :3].astype(np.int64).T
+    return (fm << 32) | (fn << 16) | (dt & 0xFFFF)
+
+
 def store_fingerprint(fingerprints, songID: int, database):
-    for fingerprint in fingerprints:
-        for (fm, fn, dt), ts in fingerprint:
-            database[(fm, fn, dt)].append((songID, ts))
+    # each row of `fingerprints` is a (fm, fn, dt, ts) quadruple
+    for key, ts in zip(_pack_keys(fingerprints).tolist(), fingerprints[:, 3].tolist()):
+        database[key].append(songID, ts)
             
             
-from collections import defaultdict
+# Above this many (songID, t_offset) bins, tallies are counted with np.unique instead
+# of a dense np.bincount, bounding the memory spent on the tally array
+_MAX_BINCOUNT_BINS = 1 << 22
 
 def query_database(fingerprints, database, songIDs):
-    # dict for keeping track of tallies
-    tallies = defaultdict(int)
+    # gather the songIDs and times of every bucket matched by a fingerprint,
+    # along with how many entries each matching fingerprint (at time tc) contributed
+    song_matches = []
+    time_matches = []
+    match_tcs = []
+    match_counts = []
+    for key, tc in zip(_pack_keys(fingerprints).tolist(), fingerprints[:, 3].tolist()):
+        bucket = database.get(key)
+        if not bucket:
+            continue
+        song_matches.append(np.frombuffer(bucket.song_ids, dtype=np.int32))
+        time_matches.append(np.frombuffer(bucket.times, dtype=np.int32))
+        match_tcs.append(tc)
+        match_counts.append(len(bucket))
 
-    # for each fingerprint, add a tally to its specific key and time offset
-    for fingerprint in fingerprints:
-        for (fm, fn, dt), tc in fingerprint:
-            for songID, ts in database[(fm, fn, dt)]:
-                t_offset = int(ts-tc)
-                tallies[(songID, t_offset)] += 1
-
-    
-    # IF SONG IN DATABASE: Print song artist and title
     # IF SONG NOT IN DATABASE: Print that not matches were found
-    if (max(tallies.values())==0):
+    if not song_matches:
         return "This song does not match any other song in the database"
+
+    song_ids = np.concatenate(song_matches).astype(np.int64)
+    t_offsets = np.concatenate(time_matches) - np.repeat(match_tcs, match_counts)
+
+    # tally all (songID, t_offset) pairs at once by mapping each pair to a single bin
+    min_offset = t_offsets.min()
+    t_range = int(t_offsets.max() - min_offset) + 1
+    bins = song_ids * t_range + (t_offsets - min_offset)
+    if (int(song_ids.max()) + 1) * t_range <= _MAX_BINCOUNT_BINS:
+        best_bin = np.bincount(bins).argmax()
     else:
-        final_ID = max(tallies, key=tallies.get)[0]
-        return f"The song that matches this is {songIDs[final_ID][0]} by {songIDs[final_ID][1]}." 
-    
+        unique_bins, counts = np.unique(bins, return_counts=True)
+        best_bin = unique_bins[counts.argmax()]
+
+    # IF SONG IN DATABASE: Print song artist and title
+    final_ID = int(best_bin) // t_range
+    return f"The song that matches this is {songIDs[final_ID][0]} by {songIDs[final_ID][1]}."
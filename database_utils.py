@@ -1,8 +1,12 @@
 """Module containing useful database functions."""
 import pickle
-from typing import Union
+import sqlite3
+from contextlib import closing
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
+from typing import Optional, Union
 import ConvertAudioRecordings
-import RandomSamples
 import audio_processing
 import database_keyfunctions
 import database_utils
@@ -39,6 +43,59 @@ def load_database(file_path: str) -> Union[dict, list]:
     with open(file_path, "rb") as file:
         return pickle.load(file)
     
+def save_fingerprints(database: dict, file_path: str, batch_size: int = 10000):
+    """
+    Saves the fingerprint database to file_path as an SQLite table, one row per
+    key holding the raw int32 songIDs and times of its bucket. Any table
+    previously saved at file_path is replaced.
+
+    Parameters
+    ----------
+    database: dict
+        Dictionary mapping each packed fingerprint key to its Bucket
+    file_path: str
+        A file path like string denoting the destination of the save
+    batch_size: int
+        Number of rows inserted per transaction
+    """
+    rows = ((key, bucket.song_ids.tobytes(), bucket.times.tobytes()) for key, bucket in database.items())
+    with closing(sqlite3.connect(file_path)) as conn:
+        conn.execute("DROP TABLE IF EXISTS fp")
+        conn.execute("CREATE TABLE fp(key INTEGER PRIMARY KEY, songs BLOB, times BLOB)")
+        while batch := list(islice(rows, batch_size)):
+            conn.executemany("INSERT INTO fp VALUES (?, ?, ?)", batch)
+            conn.commit()
+
+class FingerprintDatabase:
+    """
+    A read-only fingerprint database saved by save_fingerprints. Buckets are
+    read from disk only when looked up, through an LRU cache, so opening
+    the database takes the same time however large it is. It can be passed
+    to query_database in place of the in-memory dict.
+
+    Parameters
+    ----------
+    file_path: str
+        A file path like string denoting the source of the load
+    cache_size: int
+        Maximum number of buckets kept in memory
+    """
+    def __init__(self, file_path: str, cache_size: int = 1 << 16):
+        self._conn = sqlite3.connect(Path(file_path).absolute().as_uri() + "?mode=ro", uri=True)
+        self.get = lru_cache(maxsize=cache_size)(self._fetch)
+
+    def _fetch(self, key: int) -> Optional[database_keyfunctions.Bucket]:
+        row = self._conn.execute("SELECT songs, times FROM fp WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        bucket = database_keyfunctions.Bucket()
+        bucket.song_ids.frombytes(row[0])
+        bucket.times.frombytes(row[1])
+        return bucket
+
+    def close(self):
+        self._conn.close()
+    
 def get_info(id_to_info: list):
     """
     Prints the number of total songs and the unique artists 
@@ -63,34 +120,53 @@ def get_info(id_to_info: list):
         print("\t" + artist)
     
 from collections import defaultdict
-def populate_database(database_path: str, id_path: str, song_paths: list, song_names: list, artist_names: list):
-    database = defaultdict(list)
+from concurrent.futures import ProcessPoolExecutor
+
+def _fingerprint_song(path: str):
+    """
+    Loads the song at path and forms its fingerprints. Run in a worker process
+    by populate_database, so it must stay a module-level function.
+
+    Parameters
+    ----------
+    path: str
+        A file path like string denoting the song's audio file
+
+    Returns
+    ----------
+    numpy.ndarray, shape-(M, 4)
+        The song's (fm, fn, dt, tm) fingerprint rows
+    """
+    recorded_audio, sampling_rate = ConvertAudioRecordings.samples_file(path) # NumPy array of samples
+
+    # Generate spectrogram
+    spectrogram, freqs, times = audio_processing.produce_spectrogram(recorded_audio, sampling_rate=sampling_rate)
+
+    # Extract peaks
+    local_peaks_ind = audio_processing.extract_local_peak_idxs(spectrogram)
+
+    # Generate fingerprint
+    return audio_processing.form_fingerprints(local_peaks_ind)
+
+def populate_database(database_path: str, id_path: str, song_paths: list, song_names: list, artist_names: list,
+                      max_workers: Optional[int] = None):
+    database = defaultdict(database_keyfunctions.Bucket)
     id_to_info = []
-    
-    # FOR PATH IN SONG_PATHS
-    for i, (path, song_name, artist_name) in enumerate(zip(song_paths, song_names, artist_names)):
-        recorded_audio, sampling_rate = ConvertAudioRecordings.samples_file(path) # NumPy array of samples
-        
-        # Generate random samples of audio
-        samples = RandomSamples.random_samples(recorded_audio, sampling_rate, 20, 5)
-        
-        for sample in samples:
-            # Generate spectrogram
-            spectrogram, freqs, times = audio_processing.produce_spectrogram(recorded_audio, sampling_rate=sampling_rate)
+    songs = list(zip(song_paths, song_names, artist_names))
 
-            # Extract peaks
-            local_peaks_ind = audio_processing.extract_local_peak_idxs(spectrogram)
+    # Fingerprint the songs in parallel worker processes; `map` yields them back in song order
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        all_fingerprints = executor.map(_fingerprint_song, [path for path, _, _ in songs])
 
-            # Generate fingerprint
-            fingerprints = audio_processing.form_fingerprints(local_peaks_ind)
-    
+        # FOR PATH IN SONG_PATHS
+        for i, ((path, song_name, artist_name), fingerprints) in enumerate(zip(songs, all_fingerprints)):
             # Append fingerprint to database
             database_keyfunctions.store_fingerprint(fingerprints, i, database)
-            
-        # Append song metadata to database
-        id_to_info.append((song_name, artist_name))
+
+            # Append song metadata to database
+            id_to_info.append((song_name, artist_name))
             
     # Save databases to file_path
-    database_utils.save_database(database, database_path)
+    database_utils.save_fingerprints(database, database_path)
     database_utils.save_database(id_to_info, id_path)
     
@@ -4,7 +4,7 @@ import audio_processing
 import database_keyfunctions
 
 # Load database
-database = database_utils.load_database("database")
+database = database_utils.FingerprintDatabase("database")
 #songID list of Tuple("SongName", "SongArtist")
 songIDs = database_utils.load_database("songids")
 